@@ -21,6 +21,22 @@ class Settings(BaseSettings):
         "cost": 0.3,
         "quality": 0.2
     }
+    # Instances up to this many orders are solved
+    # with the Hungarian algorithm instead of CP-SAT
+    linear_assignment_max_orders: int = 200
+    # CP-SAT parameters, tuned for sub-second assignment solves. Only instances
+    # above linear_assignment_max_orders reach CP-SAT, so this cut-off must be
+    # larger than it for the single-worker setting to take effect
+    cp_sat_small_instance_orders: int = 500
+    cp_sat_num_workers: int = 8
+    cp_sat_linearization_level: int = 0
+    # Solves run off the event loop on a "thread" or "process" pool; each worker
+    # keeps its own CpSolver. Processes avoid the GIL for the Python model build
+    solver_executor: str = "thread"
+    solver_threads: int = 4
+    solver_processes: int = 4
+    # Compile kernels and initialize OR-Tools before serving traffic
+    warm_up_on_startup: bool = True
     
     # Logging Configuration
     log_level: str = "INFO"
@@ -39,6 +55,8 @@ class Settings(BaseSettings):
     # Database Configuration (for future use)
     database_url: Optional[str] = None
     redis_url: Optional[str] = None
+    # Optimization responses are cached in Redis for this long when redis_url is set
+    optimization_cache_ttl_seconds: int = 5
     
     # Kafka Configuration (for future use)
     kafka_bootstrap_servers: Optional[str] = None
@@ -1,18 +1,41 @@
 
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Optional
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, model_validator
+from typing import List, Dict, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import multiprocessing
+import threading
 import time
 import logging
 import structlog
+import orjson
+import redis.asyncio as redis
 from ortools.sat.python import cp_model
+import numpy as np
+from scipy.optimize import linear_sum_assignment
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry, multiprocess
 from prometheus_client.registry import REGISTRY
 import os
 
+from config import settings
+from optimization_kernels import build_score_matrix
+
 # Configure structured logging
+def orjson_dumps(obj, **kwargs) -> str:
+    # JSONRenderer serializer backed by orjson; keeps structlog's fallback for unknown types
+    return orjson.dumps(obj, default=kwargs.get("default")).decode()
+
+# Only the service's own logger follows LOG_LEVEL; third-party loggers such as httpx
+# stay at the root's WARNING default instead of logging every call
+logging.basicConfig(format="%(message)s")
+logging.getLogger(__name__).setLevel(settings.log_level.upper())
+
 structlog.configure(
     processors=[
         structlog.stdlib.filter_by_level,
@@ -23,7 +46,7 @@ structlog.configure(
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
         structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=orjson_dumps)
     ],
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
@@ -31,14 +54,27 @@ structlog.configure(
     cache_logger_on_first_use=True,
 )
 
-logger = structlog.get_logger()
+logger = structlog.get_logger(__name__).bind(service=settings.service_name)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.warm_up_on_startup:
+        # Warm a solver worker so the first request does not pay the one-time costs
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(get_solver_executor(), warm_up_optimizer)
+    yield
+    shutdown_solver_executor()
+    if redis_client is not None:
+        await redis_client.close()
 
 app = FastAPI(
     title="UOOM Optimization Service", 
     version="1.0.0",
     description="High-performance optimization service using Google OR-Tools for delivery routing",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -51,32 +87,66 @@ app.add_middleware(
 )
 
 # Metrics
-optimization_requests = Counter('optimization_requests_total', 'Total optimization requests')
-optimization_duration = Histogram('optimization_duration_seconds', 'Optimization duration')
-optimization_errors = Counter('optimization_errors_total', 'Total optimization errors')
-optimization_success = Counter('optimization_success_total', 'Total successful optimizations')
+def get_or_create_metric(metric_type, name: str, documentation: str):
+    # This module can be executed twice in one process, e.g. loaded again under another
+    # name by importlib or a test harness; reuse the collector registered first instead
+    # of failing on the duplicate. prometheus_client has no public lookup by name,
+    # hence the private registry mapping
+    try:
+        return metric_type(name, documentation)
+    except ValueError:
+        return REGISTRY._names_to_collectors[name]
+
+optimization_requests = get_or_create_metric(Counter, 'optimization_requests_total', 'Total optimization requests')
+optimization_duration = get_or_create_metric(Histogram, 'optimization_duration_seconds', 'Optimization duration')
+optimization_errors = get_or_create_metric(Counter, 'optimization_errors_total', 'Total optimization errors')
+optimization_success = get_or_create_metric(Counter, 'optimization_success_total', 'Total successful optimizations')
+optimization_cache_hits = get_or_create_metric(
+    Counter, 'optimization_cache_hits_total', 'Total optimization responses served from cache'
+)
+
+# Response cache, disabled unless REDIS_URL is configured
+redis_client = redis.from_url(settings.redis_url) if settings.redis_url else None
+
+# Solver statuses counted as successes and worth caching
+SUCCESS_STATUSES = {"OPTIMAL", "FEASIBLE"}
+
+# Weight keys in the order the score kernel expects them
+WEIGHT_KEYS = ("delivery_time", "cost", "quality")
+
+class Location(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
+    lat: float = Field(..., description="Latitude")
+    lng: float = Field(..., description="Longitude")
 
 class Order(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str = Field(..., description="Unique order identifier")
-    pickup_location: Dict[str, float] = Field(..., description="Pickup coordinates {lat, lng}")
-    delivery_location: Dict[str, float] = Field(..., description="Delivery coordinates {lat, lng}")
+    pickup_location: Location = Field(..., description="Pickup coordinates {lat, lng}")
+    delivery_location: Location = Field(..., description="Delivery coordinates {lat, lng}")
     priority: int = Field(default=1, ge=1, le=10, description="Order priority (1-10)")
     max_delivery_time: int = Field(default=60, ge=1, description="Maximum delivery time in minutes")
     weight: float = Field(default=1.0, ge=0.1, description="Order weight in kg")
     special_requirements: List[str] = Field(default_factory=list, description="Special handling requirements")
 
 class Channel(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str = Field(..., description="Unique channel identifier")
     capacity: int = Field(..., ge=1, description="Channel capacity")
     current_load: int = Field(default=0, ge=0, description="Current load")
     cost_per_order: float = Field(default=0.0, ge=0, description="Cost per order")
     quality_score: int = Field(default=100, ge=0, le=100, description="Quality score (0-100)")
     prep_time_minutes: int = Field(default=30, ge=1, description="Preparation time in minutes")
-    location: Dict[str, float] = Field(..., description="Channel location coordinates {lat, lng}")
+    location: Location = Field(..., description="Channel location coordinates {lat, lng}")
     vehicle_type: str = Field(default="standard", description="Vehicle type")
     max_distance: float = Field(default=50.0, ge=1, description="Maximum delivery distance in km")
 
 class OptimizationRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     orders: List[Order] = Field(..., min_items=1, description="List of orders to optimize")
     channels: List[Channel] = Field(..., min_items=1, description="List of available channels")
     constraints: Dict = Field(default_factory=dict, description="Additional constraints")
@@ -90,12 +160,22 @@ class OptimizationRequest(BaseModel):
     )
     timeout_seconds: float = Field(default=0.1, ge=0.01, le=10.0, description="Optimization timeout in seconds")
     
-    @validator('weights')
-    def validate_weights(cls, v):
-        total = sum(v.values())
-        if abs(total - 1.0) > 0.01:
+    _weights_vec: Tuple[float, float, float] = PrivateAttr()
+    
+    @model_validator(mode='after')
+    def validate_weights(self):
+        if set(self.weights) != set(WEIGHT_KEYS):
+            raise ValueError(f"Weights must have exactly the keys {', '.join(WEIGHT_KEYS)}")
+        weights_vec = tuple(self.weights[key] for key in WEIGHT_KEYS)
+        if abs(sum(weights_vec) - 1.0) > 0.01:
             raise ValueError("Weights must sum to 1.0")
-        return v
+        self._weights_vec = weights_vec
+        return self
+    
+    @property
+    def weights_vec(self) -> Tuple[float, float, float]:
+        # Weights as (delivery_time, cost, quality), resolved once at validation
+        return self._weights_vec
 
 class OptimizationResponse(BaseModel):
     assignments: Dict[str, str] = Field(..., description="Order ID to channel ID assignments")
@@ -104,65 +184,86 @@ class OptimizationResponse(BaseModel):
     status: str = Field(..., description="Optimization status")
     metadata: Dict = Field(default_factory=dict, description="Additional optimization metadata")
 
+_solver_pool = threading.local()
+
+def get_solver() -> cp_model.CpSolver:
+    # One CpSolver per worker thread, reused across requests
+    solver = getattr(_solver_pool, 'solver', None)
+    if solver is None:
+        solver = _solver_pool.solver = cp_model.CpSolver()
+    return solver
+
 class ConstraintOptimizer:
-    def __init__(self):
-        self.model = cp_model.CpModel()
-        self.solver = cp_model.CpSolver()
-        
+    # Stateless: the model is built per call and the solver comes from the
+    # calling thread's pool, so one instance is safe to share across threads
+    
     def optimize_routing(self, request: OptimizationRequest) -> OptimizationResponse:
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         try:
-            # Clear previous model
-            self.model = cp_model.CpModel()
-            self.solver = cp_model.CpSolver()
-            self.solver.parameters.max_time_in_seconds = request.timeout_seconds
+            orders = request.orders
+            channels = request.channels
             
-            orders = [order.dict() for order in request.orders]
-            channels = [channel.dict() for channel in request.channels]
+            # All pairwise scores and feasibility, indexed [order, channel]
+            scores, feasible = self._calculate_score_matrix(orders, channels, request.weights_vec)
             
-            # Decision variables
-            assignments = {}
-            for order in orders:
-                for channel in channels:
-                    assignments[(order['id'], channel['id'])] = self.model.NewBoolVar(
-                        f'assign_{order["id"]}_to_{channel["id"]}'
-                    )
+            if not feasible.any(axis=1).all():
+                solve_time = (time.perf_counter_ns() - start_time) // 1_000_000
+                logger.warning("Order without feasible channel, using fallback assignment",
+                             solve_time_ms=solve_time)
+                return self._fallback_assignment(
+                    orders, channels, solve_time, "Order without feasible channel"
+                )
             
-            # Constraints
-            self._add_assignment_constraints(orders, channels, assignments)
-            self._add_capacity_constraints(orders, channels, assignments)
-            self._add_delivery_time_constraints(orders, channels, assignments)
-            self._add_distance_constraints(orders, channels, assignments)
+            # Small instances are solved exactly by the Hungarian algorithm,
+            # skipping CP-SAT model construction and solver startup entirely
+            if self._use_linear_assignment(orders):
+                return self._solve_linear_assignment(orders, channels, scores, feasible, start_time)
+            
+            model = cp_model.CpModel()
+            solver = get_solver()
+            self._configure_solver(solver, request, len(orders))
             
-            # Objective function
-            objective_terms = []
-            for order in orders:
-                for channel in channels:
-                    score = self._calculate_assignment_score(order, channel, request.weights)
-                    objective_terms.append(assignments[(order['id'], channel['id'])] * score)
+            # Decision variables, only for pairs satisfying delivery time and distance
+            # limits. Variables are left unnamed: names are only used for debugging and
+            # formatting one string per pair dominated model construction
+            rows, cols = np.nonzero(feasible)
+            rows, cols = rows.tolist(), cols.tolist()
+            assignments = [model.NewBoolVar("") for _ in rows]
             
-            self.model.Minimize(sum(objective_terms))
+            # Group variables per order and per channel in one pass
+            order_assignments = [[] for _ in orders]
+            channel_assignments = [[] for _ in channels]
+            for i, j, assignment in zip(rows, cols, assignments):
+                order_assignments[i].append(assignment)
+                channel_assignments[j].append(assignment)
+            
+            # Constraints
+            self._add_assignment_constraints(model, order_assignments)
+            self._add_capacity_constraints(model, channels, channel_assignments)
+            
+            # Objective function, built in a single call rather than term by term
+            pair_scores = scores[rows, cols].tolist()
+            model.Minimize(cp_model.LinearExpr.WeightedSum(assignments, pair_scores))
             
             # Solve
-            status = self.solver.Solve(self.model)
-            solve_time = int((time.time() - start_time) * 1000)
+            status = solver.Solve(model)
+            solve_time = (time.perf_counter_ns() - start_time) // 1_000_000
             
             if status in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
                 assignments_result = {}
                 total_score = 0
                 
-                for order in orders:
-                    for channel in channels:
-                        if self.solver.Value(assignments[(order['id'], channel['id'])]):
-                            assignments_result[order['id']] = channel['id']
-                            total_score += self._calculate_assignment_score(order, channel, request.weights)
+                for i, j, assignment, score in zip(rows, cols, assignments, pair_scores):
+                    if solver.BooleanValue(assignment):
+                        assignments_result[orders[i].id] = channels[j].id
+                        total_score += score
                 
-                optimization_success.inc()
-                logger.info("Optimization completed successfully", 
-                          status=status, 
-                          solve_time_ms=solve_time,
-                          assignments_count=len(assignments_result))
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Optimization completed successfully", 
+                              status=status, 
+                              solve_time_ms=solve_time,
+                              assignments_count=len(assignments_result))
                 
                 return OptimizationResponse(
                     assignments=assignments_result,
@@ -170,6 +271,7 @@ class ConstraintOptimizer:
                     solve_time_ms=solve_time,
                     status="OPTIMAL" if status == cp_model.OPTIMAL else "FEASIBLE",
                     metadata={
+                        "solver": "cp_sat",
                         "solver_status": str(status),
                         "orders_count": len(orders),
                         "channels_count": len(channels)
@@ -180,135 +282,272 @@ class ConstraintOptimizer:
                 logger.warning("Optimization failed, using fallback assignment", 
                              status=status, 
                              solve_time_ms=solve_time)
-                return self._fallback_assignment(orders, channels, solve_time)
+                return self._fallback_assignment(
+                    orders, channels, solve_time, "Optimization solver failed"
+                )
                 
         except Exception as e:
             logger.error("Optimization failed", error=str(e), exc_info=True)
-            optimization_errors.inc()
             raise HTTPException(status_code=500, detail=f"Optimization failed: {str(e)}")
 
-    def _add_assignment_constraints(self, orders, channels, assignments):
-        # Each order assigned to exactly one channel
-        for order in orders:
-            self.model.Add(
-                sum(assignments[(order['id'], channel['id'])] for channel in channels) == 1
-            )
-
-    def _add_capacity_constraints(self, orders, channels, assignments):
-        # Channel capacity constraints
-        for channel in channels:
-            available_capacity = channel['capacity'] - channel['current_load']
-            self.model.Add(
-                sum(assignments[(order['id'], channel['id'])] for order in orders) <= available_capacity
-            )
+    def _configure_solver(self, solver: cp_model.CpSolver, request: OptimizationRequest,
+                          orders_count: int):
+        # Every parameter is set explicitly since pooled solvers keep them between requests
+        parameters = solver.parameters
+        parameters.max_time_in_seconds = request.timeout_seconds
+        parameters.linearization_level = settings.cp_sat_linearization_level
+        parameters.cp_model_presolve = True
+        
+        # Worker threads cost more than they return on small models
+        if orders_count < settings.cp_sat_small_instance_orders:
+            parameters.num_workers = 1
+            parameters.search_branching = cp_model.AUTOMATIC_SEARCH
+        else:
+            parameters.num_workers = settings.cp_sat_num_workers
+            parameters.search_branching = cp_model.PORTFOLIO_SEARCH
 
-    def _add_delivery_time_constraints(self, orders, channels, assignments):
-        # Delivery time constraints
-        for order in orders:
-            for channel in channels:
-                estimated_time = self._calculate_delivery_time(order, channel)
-                if estimated_time > order.get('max_delivery_time', 60):
-                    self.model.Add(assignments[(order['id'], channel['id'])] == 0)
+    def _use_linear_assignment(self, orders) -> bool:
+        # The model has no constraints coupling orders beyond channel capacity, so
+        # every instance is a linear assignment problem and the choice is purely by
+        # size: large ones stay on CP-SAT, which respects the request timeout
+        return len(orders) <= settings.linear_assignment_max_orders
 
-    def _add_distance_constraints(self, orders, channels, assignments):
-        # Distance constraints
-        for order in orders:
-            for channel in channels:
-                distance = self._calculate_distance(order, channel)
-                if distance > channel.get('max_distance', 50.0):
-                    self.model.Add(assignments[(order['id'], channel['id'])] == 0)
-
-    def _calculate_assignment_score(self, order: Dict, channel: Dict, weights: Dict) -> int:
-        delivery_time = self._calculate_delivery_time(order, channel)
-        cost = channel.get('cost_per_order', 0)
-        quality_penalty = max(0, 100 - channel.get('quality_score', 100))
+    def _solve_linear_assignment(self, orders, channels, scores, feasible,
+                                 start_time) -> OptimizationResponse:
+        # Expand each channel into one column per free slot; an order never needs more
+        # slots than there are orders, so columns are capped at len(orders) per channel
+        column_channels = []
+        for j, channel in enumerate(channels):
+            free_slots = max(0, channel.capacity - channel.current_load)
+            column_channels.extend([j] * min(free_slots, len(orders)))
         
-        # Add priority factor
-        priority_factor = (11 - order.get('priority', 1)) / 10.0
+        if len(column_channels) < len(orders):
+            solve_time = (time.perf_counter_ns() - start_time) // 1_000_000
+            logger.warning("Insufficient capacity for linear assignment, using fallback assignment",
+                         solve_time_ms=solve_time)
+            return self._fallback_assignment(
+                orders, channels, solve_time, "Insufficient channel capacity"
+            )
         
-        weighted_score = (
-            delivery_time * weights['delivery_time'] +
-            cost * weights['cost'] +
-            quality_penalty * weights['quality']
-        ) * priority_factor
+        costs = np.where(feasible, scores, np.inf)
         
-        return int(weighted_score * 100)  # Scale for integer optimization
-
-    def _calculate_delivery_time(self, order: Dict, channel: Dict) -> float:
-        # Simplified calculation - integrate with OSRM/VROOM in production
-        prep_time = channel.get('prep_time_minutes', 30)
-        distance = self._calculate_distance(order, channel)
-        # Assume 30 km/h average speed
-        travel_time = (distance / 30.0) * 60  # Convert to minutes
-        return prep_time + travel_time
-
-    def _calculate_distance(self, order: Dict, channel: Dict) -> float:
-        # Simplified Haversine distance calculation
-        # In production, use proper geospatial libraries
-        import math
+        try:
+            rows, cols = linear_sum_assignment(costs[:, column_channels])
+        except ValueError:
+            # Raised when forbidden pairs leave no complete assignment
+            solve_time = (time.perf_counter_ns() - start_time) // 1_000_000
+            logger.warning("Linear assignment infeasible, using fallback assignment",
+                         solve_time_ms=solve_time)
+            return self._fallback_assignment(
+                orders, channels, solve_time, "No complete assignment within limits"
+            )
         
-        def haversine_distance(lat1, lon1, lat2, lon2):
-            R = 6371  # Earth's radius in kilometers
-            
-            lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            
-            a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-            c = 2 * math.asin(math.sqrt(a))
-            return R * c
+        assignments_result = {}
+        total_score = 0
+        for i, col in zip(rows, cols):
+            j = column_channels[col]
+            assignments_result[orders[i].id] = channels[j].id
+            total_score += int(scores[i, j])
         
-        # Calculate distance from channel to pickup to delivery
-        channel_lat = channel['location']['lat']
-        channel_lng = channel['location']['lng']
-        pickup_lat = order['pickup_location']['lat']
-        pickup_lng = order['pickup_location']['lng']
-        delivery_lat = order['delivery_location']['lat']
-        delivery_lng = order['delivery_location']['lng']
+        solve_time = (time.perf_counter_ns() - start_time) // 1_000_000
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Optimization completed successfully", 
+                      status="OPTIMAL", 
+                      solve_time_ms=solve_time,
+                      assignments_count=len(assignments_result))
         
-        distance_to_pickup = haversine_distance(channel_lat, channel_lng, pickup_lat, pickup_lng)
-        distance_pickup_to_delivery = haversine_distance(pickup_lat, pickup_lng, delivery_lat, delivery_lng)
+        return OptimizationResponse(
+            assignments=assignments_result,
+            total_score=total_score,
+            solve_time_ms=solve_time,
+            status="OPTIMAL",
+            metadata={
+                "solver": "linear_sum_assignment",
+                "orders_count": len(orders),
+                "channels_count": len(channels)
+            }
+        )
+
+    def _add_assignment_constraints(self, model, order_assignments):
+        # Each order assigned to exactly one feasible channel
+        for assignments in order_assignments:
+            model.Add(cp_model.LinearExpr.Sum(assignments) == 1)
+
+    def _add_capacity_constraints(self, model, channels, channel_assignments):
+        # Channel capacity constraints
+        for channel, assignments in zip(channels, channel_assignments):
+            if not assignments:
+                continue
+            # Overloaded channels take no orders, as in the linear assignment path
+            available_capacity = max(0, channel.capacity - channel.current_load)
+            model.Add(cp_model.LinearExpr.Sum(assignments) <= available_capacity)
+
+    def _calculate_score_matrix(self, orders, channels, weights_vec: Tuple[float, float, float]):
+        channel_coords = np.radians([[channel.location.lat, channel.location.lng] for channel in channels])
+        pickup_coords = np.radians([[order.pickup_location.lat, order.pickup_location.lng] for order in orders])
+        delivery_coords = np.radians(
+            [[order.delivery_location.lat, order.delivery_location.lng] for order in orders]
+        )
         
-        return distance_to_pickup + distance_pickup_to_delivery
+        return build_score_matrix(
+            channel_coords[:, 0], channel_coords[:, 1],
+            pickup_coords[:, 0], pickup_coords[:, 1],
+            delivery_coords[:, 0], delivery_coords[:, 1],
+            np.array([channel.prep_time_minutes for channel in channels], dtype=np.float64),
+            np.array([channel.cost_per_order for channel in channels], dtype=np.float64),
+            np.array([channel.quality_score for channel in channels], dtype=np.float64),
+            np.array([channel.max_distance for channel in channels], dtype=np.float64),
+            np.array([order.max_delivery_time for order in orders], dtype=np.float64),
+            np.array([order.priority for order in orders], dtype=np.float64),
+            *weights_vec
+        )
 
-    def _fallback_assignment(self, orders, channels, solve_time) -> OptimizationResponse:
+    def _fallback_assignment(self, orders, channels, solve_time, reason: str) -> OptimizationResponse:
         # Simple round-robin fallback with capacity checking
         assignments = {}
-        channel_loads = {channel['id']: channel['current_load'] for channel in channels}
+        channel_loads = {channel.id: channel.current_load for channel in channels}
         
         for order in orders:
             assigned = False
             for channel in channels:
-                if channel_loads[channel['id']] < channel['capacity']:
-                    assignments[order['id']] = channel['id']
-                    channel_loads[channel['id']] += 1
+                if channel_loads[channel.id] < channel.capacity:
+                    assignments[order.id] = channel.id
+                    channel_loads[channel.id] += 1
                     assigned = True
                     break
             
             if not assigned:
                 # If no channel available, assign to first channel (will be rejected by capacity constraint)
-                assignments[order['id']] = channels[0]['id']
+                assignments[order.id] = channels[0].id
         
         return OptimizationResponse(
             assignments=assignments,
             total_score=0,
             solve_time_ms=solve_time,
             status="FALLBACK",
-            metadata={"fallback_reason": "Optimization solver failed"}
+            metadata={"fallback_reason": reason}
         )
 
 optimizer = ConstraintOptimizer()
+_solver_executor: Optional[Executor] = None
+
+def warm_up_optimizer():
+    # Compiles the score kernel (or loads it from the numba cache) and pays OR-Tools
+    # protobuf setup on a trivial model, without touching the request metrics
+    location = Location(lat=0.0, lng=0.0)
+    request = OptimizationRequest(
+        orders=[Order(id="warm_up", pickup_location=location, delivery_location=location)],
+        channels=[Channel(id="warm_up", capacity=1, location=location)]
+    )
+    scores, _ = optimizer._calculate_score_matrix(request.orders, request.channels, request.weights_vec)
+    linear_sum_assignment(scores)
+    
+    model = cp_model.CpModel()
+    assignment = model.NewBoolVar("warm_up")
+    model.Add(assignment == 1)
+    model.Minimize(assignment)
+    get_solver().Solve(model)
+
+class OptimizationError(Exception):
+    pass
+
+def solve_in_process(request: OptimizationRequest) -> OptimizationResponse:
+    # HTTPException cannot be unpickled, so failures cross the process boundary
+    # as OptimizationError and are turned back into a 500 by the handler
+    try:
+        return optimizer.optimize_routing(request)
+    except HTTPException as e:
+        raise OptimizationError(e.detail) from None
+
+def get_solver_executor() -> Executor:
+    # Created on first use so the app can be restarted after a shutdown
+    global _solver_executor
+    if _solver_executor is None:
+        if settings.solver_executor == "process":
+            # Spawned rather than forked: the parent already runs solver and server threads
+            _solver_executor = ProcessPoolExecutor(
+                max_workers=settings.solver_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up_optimizer
+            )
+        else:
+            _solver_executor = ThreadPoolExecutor(
+                max_workers=settings.solver_threads, thread_name_prefix="solver"
+            )
+    return _solver_executor
+
+def shutdown_solver_executor():
+    global _solver_executor
+    if _solver_executor is not None:
+        _solver_executor.shutdown(wait=True)
+        _solver_executor = None
 
 @app.post("/optimize", response_model=OptimizationResponse)
 async def optimize_routing(request: OptimizationRequest):
     optimization_requests.inc()
     
-    logger.info("Received optimization request", 
-               orders_count=len(request.orders),
-               channels_count=len(request.channels))
+    # Checked up front so filtered-out events never build their kwargs
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Received optimization request", 
+                   orders_count=len(request.orders),
+                   channels_count=len(request.channels))
+    
+    cache_key = None
+    if redis_client is not None:
+        cache_key = get_cache_key(request)
+        cached = await get_cached_response(cache_key)
+        if cached is not None:
+            optimization_cache_hits.inc()
+            return cached
     
     with optimization_duration.time():
-        return optimizer.optimize_routing(request)
+        # Solve off the event loop so concurrent requests are not blocked
+        loop = asyncio.get_running_loop()
+        executor = get_solver_executor()
+        # Outcomes are counted here rather than in the solver, since counters
+        # incremented inside a process pool worker never reach this process
+        try:
+            if isinstance(executor, ProcessPoolExecutor):
+                try:
+                    result = await loop.run_in_executor(executor, solve_in_process, request)
+                except OptimizationError as e:
+                    raise HTTPException(status_code=500, detail=str(e))
+            else:
+                result = await loop.run_in_executor(executor, optimizer.optimize_routing, request)
+        except HTTPException:
+            optimization_errors.inc()
+            raise
+    
+    if result.status in SUCCESS_STATUSES:
+        optimization_success.inc()
+    
+    # Fallbacks reflect transient failures such as timeouts and are not worth replaying
+    if cache_key is not None and result.status in SUCCESS_STATUSES:
+        await cache_response(cache_key, result)
+    return result
+
+def get_cache_key(request: OptimizationRequest) -> str:
+    # Canonical request body: sorted keys so equivalent requests share an entry
+    body = orjson.dumps(request.model_dump(), option=orjson.OPT_SORT_KEYS)
+    return f"opt:{hashlib.sha256(body).hexdigest()}"
+
+async def get_cached_response(cache_key: str) -> Optional[OptimizationResponse]:
+    try:
+        cached = await redis_client.get(cache_key)
+    except redis.RedisError as e:
+        logger.warning("Optimization cache read failed", error=str(e))
+        return None
+    if cached is None:
+        return None
+    return OptimizationResponse(**orjson.loads(cached))
+
+async def cache_response(cache_key: str, response: OptimizationResponse):
+    try:
+        await redis_client.setex(
+            cache_key, settings.optimization_cache_ttl_seconds, orjson.dumps(response.model_dump())
+        )
+    except redis.RedisError as e:
+        logger.warning("Optimization cache write failed", error=str(e))
 
 @app.get("/health")
 async def health_check():
@@ -321,11 +560,21 @@ async def health_check():
 
 @app.get("/metrics")
 async def metrics():
-    return JSONResponse(
-        content=generate_latest(REGISTRY),
+    # generate_latest already returns the encoded text format
+    return Response(
+        content=generate_latest(get_metrics_registry()),
         media_type=CONTENT_TYPE_LATEST
     )
 
+def get_metrics_registry() -> CollectorRegistry:
+    # With multiple uvicorn workers each process only sees its own samples;
+    # PROMETHEUS_MULTIPROC_DIR switches to aggregating across all of them
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error("Unhandled exception", 
@@ -333,7 +582,7 @@ async def global_exception_handler(request: Request, exc: Exception):
                 method=request.method,
                 error=str(exc),
                 exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
     )
@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+from numba import njit
+
+EARTH_RADIUS_KM = 6371.0
+AVERAGE_SPEED_KMH = 30.0  # Simplified - integrate with OSRM/VROOM in production
+
+
+@njit(fastmath=True, cache=True)
+def haversine_distance(lat1, lng1, lat2, lng2):
+    # Great-circle distance in km between two points given in radians
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+@njit(fastmath=True, cache=True)
+def build_score_matrix(ch_lat, ch_lng, pu_lat, pu_lng, dv_lat, dv_lng, prep, cost, quality,
+                       max_dist, max_time, priority, w_dt, w_c, w_q):
+    # Fused distance, delivery time, feasibility and score computation for every
+    # (order, channel) pair. Coordinates are in radians; returns scores scaled by
+    # 100 for integer optimization and the feasibility mask, both [order, channel]
+    n_orders = pu_lat.shape[0]
+    n_channels = ch_lat.shape[0]
+    scores = np.empty((n_orders, n_channels), dtype=np.int64)
+    feasible = np.empty((n_orders, n_channels), dtype=np.bool_)
+
+    for i in range(n_orders):
+        pickup_to_delivery = haversine_distance(pu_lat[i], pu_lng[i], dv_lat[i], dv_lng[i])
+        priority_factor = (11 - priority[i]) / 10.0
+
+        for j in range(n_channels):
+            # Distance from channel to pickup to delivery
+            to_pickup = haversine_distance(ch_lat[j], ch_lng[j], pu_lat[i], pu_lng[i])
+            distance = to_pickup + pickup_to_delivery
+            delivery_time = prep[j] + (distance / AVERAGE_SPEED_KMH) * 60
+            feasible[i, j] = delivery_time <= max_time[i] and distance <= max_dist[j]
+
+            quality_penalty = max(0.0, 100.0 - quality[j])
+            weighted_score = (
+                delivery_time * w_dt +
+                cost[j] * w_c +
+                quality_penalty * w_q
+            ) * priority_factor
+            scores[i, j] = np.int64(weighted_score * 100)
+
+    return scores, feasible
@@ -1,7 +1,14 @@
 import pytest
 import httpx
 import asyncio
-from main import app
+import importlib.util
+import logging
+import random
+import time
+from ortools.sat.python import cp_model
+import main
+from main import app, optimizer, OptimizationRequest
+from config import settings
 from fastapi.testclient import TestClient
 
 client = TestClient(app)
@@ -18,7 +25,8 @@ def test_metrics_endpoint():
     """Test metrics endpoint"""
     response = client.get("/metrics")
     assert response.status_code == 200
-    assert "optimization_requests_total" in response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE optimization_requests_total counter\n" in response.text
 
 def test_optimization_endpoint():
     """Test optimization endpoint with sample data"""
@@ -98,6 +106,336 @@ def test_optimization_endpoint():
     # Verify status is valid
     assert data["status"] in ["OPTIMAL", "FEASIBLE", "FALLBACK"]
 
+def test_optimization_respects_capacity():
+    """Test that channel capacity is respected by the assignment"""
+    request = {
+        "orders": [
+            {
+                "id": f"order_{i}",
+                "pickup_location": {"lat": 40.7128, "lng": -74.0060},
+                "delivery_location": {"lat": 40.7589, "lng": -73.9851}
+            }
+            for i in range(3)
+        ],
+        "channels": [
+            {
+                "id": "channel_1",
+                "capacity": 2,
+                "current_load": 1,
+                "cost_per_order": 1.0,
+                "location": {"lat": 40.7128, "lng": -74.0060}
+            },
+            {
+                "id": "channel_2",
+                "capacity": 5,
+                "cost_per_order": 9.0,
+                "location": {"lat": 40.7505, "lng": -73.9934}
+            }
+        ]
+    }
+    
+    response = client.post("/optimize", json=request)
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["status"] == "OPTIMAL"
+    assignments = list(data["assignments"].values())
+    assert len(assignments) == 3
+    assert assignments.count("channel_1") == 1
+    assert assignments.count("channel_2") == 2
+
+def make_random_request(orders_count, channels_count, seed=0, overloaded_channel=False):
+    """Build a random but feasible optimization request"""
+    rng = random.Random(seed)
+    
+    def location():
+        return {"lat": 40.7 + rng.random() * 0.05, "lng": -74.0 + rng.random() * 0.05}
+    
+    # The cheapest channel, but already loaded beyond its capacity
+    extra_channels = [
+        {
+            "id": "channel_overloaded",
+            "capacity": 2,
+            "current_load": 5,
+            "location": location()
+        }
+    ] if overloaded_channel else []
+    
+    return OptimizationRequest(
+        orders=[
+            {
+                "id": f"order_{i}",
+                "pickup_location": location(),
+                "delivery_location": location(),
+                "priority": rng.randint(1, 10),
+                "max_delivery_time": 90
+            }
+            for i in range(orders_count)
+        ],
+        channels=[
+            {
+                "id": f"channel_{j}",
+                "capacity": rng.randint(orders_count // channels_count + 1, orders_count + 1),
+                "cost_per_order": rng.random() * 10,
+                "quality_score": rng.randint(50, 100),
+                "location": location()
+            }
+            for j in range(channels_count)
+        ] + extra_channels,
+        timeout_seconds=5.0
+    )
+
+@pytest.mark.parametrize("seed", range(3))
+def test_cp_sat_matches_linear_assignment(monkeypatch, seed):
+    """Test that CP-SAT and the Hungarian algorithm agree on the optimal score"""
+    request = make_random_request(30, 5, seed, overloaded_channel=True)
+    
+    linear = optimizer.optimize_routing(request)
+    monkeypatch.setattr(settings, "linear_assignment_max_orders", 0)
+    cp_sat = optimizer.optimize_routing(request)
+    
+    assert linear.metadata["solver"] == "linear_sum_assignment"
+    assert cp_sat.metadata["solver"] == "cp_sat"
+    assert linear.status == cp_sat.status == "OPTIMAL"
+    assert cp_sat.total_score == linear.total_score
+    assert len(cp_sat.assignments) == 30
+    assert "channel_overloaded" not in cp_sat.assignments.values()
+
+def test_cp_sat_defaults_reach_single_worker_branch():
+    """Test that some instances routed to CP-SAT by default run single-worker"""
+    assert settings.cp_sat_small_instance_orders > settings.linear_assignment_max_orders
+
+@pytest.mark.parametrize("orders_count,num_workers,search_branching", [
+    (settings.cp_sat_small_instance_orders - 1, 1, cp_model.AUTOMATIC_SEARCH),
+    (settings.cp_sat_small_instance_orders, settings.cp_sat_num_workers, cp_model.PORTFOLIO_SEARCH),
+])
+def test_configure_solver(orders_count, num_workers, search_branching):
+    """Test CP-SAT parameters on both sides of the small instance cut-off"""
+    solver = cp_model.CpSolver()
+    request = make_random_request(1, 1)
+    
+    optimizer._configure_solver(solver, request, orders_count)
+    
+    assert solver.parameters.num_workers == num_workers
+    assert solver.parameters.search_branching == search_branching
+    assert solver.parameters.max_time_in_seconds == request.timeout_seconds
+
+def test_concurrent_cp_sat_optimizations(monkeypatch):
+    """Test concurrent CP-SAT solves through the solver executor"""
+    monkeypatch.setattr(settings, "linear_assignment_max_orders", 0)
+    request = make_random_request(20, 4).model_dump()
+    
+    async def run():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            return await asyncio.gather(
+                *[async_client.post("/optimize", json=request) for _ in range(8)]
+            )
+    
+    responses = asyncio.run(run())
+    
+    results = [response.json() for response in responses]
+    assert all(response.status_code == 200 for response in responses)
+    assert all(result["metadata"]["solver"] == "cp_sat" for result in results)
+    assert len({result["total_score"] for result in results}) == 1
+
+def test_process_solver_executor(monkeypatch):
+    """Test solving on the process pool executor"""
+    monkeypatch.setattr(settings, "solver_executor", "process")
+    main.shutdown_solver_executor()
+    before = main.optimization_success._value.get()
+    try:
+        response = client.post("/optimize", json=make_random_request(5, 2).model_dump())
+        assert isinstance(main.get_solver_executor(), main.ProcessPoolExecutor)
+    finally:
+        main.shutdown_solver_executor()
+    
+    assert response.status_code == 200
+    assert response.json()["status"] == "OPTIMAL"
+    # Counted in this process, not only inside the worker
+    assert main.optimization_success._value.get() == before + 1
+
+def test_optimization_error_counted(monkeypatch):
+    """Test that solver failures are counted by the request handler"""
+    def fail(request):
+        raise main.HTTPException(status_code=500, detail="Optimization failed: boom")
+    
+    monkeypatch.setattr(optimizer, "optimize_routing", fail)
+    before = main.optimization_errors._value.get()
+    response = client.post("/optimize", json=make_random_request(5, 2).model_dump())
+    
+    assert response.status_code == 500
+    assert main.optimization_errors._value.get() == before + 1
+
+def test_solve_in_process_converts_http_exception(monkeypatch):
+    """Test that solver failures are made picklable for the process pool"""
+    def fail(request):
+        raise main.HTTPException(status_code=500, detail="Optimization failed: boom")
+    monkeypatch.setattr(optimizer, "optimize_routing", fail)
+    
+    with pytest.raises(main.OptimizationError, match="boom"):
+        main.solve_in_process(make_random_request(1, 1))
+
+def test_warm_up_optimizer():
+    """Test that warm-up solves without counting as a request"""
+    before = main.optimization_success._value.get()
+    main.warm_up_optimizer()
+    assert main.optimization_success._value.get() == before
+
+def test_optimization_load(benchmark, monkeypatch):
+    """Load test concurrent CP-SAT solves through the async request path"""
+    monkeypatch.setattr(settings, "linear_assignment_max_orders", 0)
+    request = make_random_request(100, 10).model_dump()
+    request["timeout_seconds"] = 0.5  # Large enough to run to the time limit
+    concurrency = settings.solver_threads
+    
+    async def run_batch():
+        done = asyncio.Event()
+        gaps = []
+        
+        async def heartbeat():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+        
+        async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+            ticker = asyncio.create_task(heartbeat())
+            start = time.perf_counter()
+            responses = await asyncio.gather(
+                *[async_client.post("/optimize", json=request) for _ in range(concurrency)]
+            )
+            wall_time = time.perf_counter() - start
+            done.set()
+            await ticker
+        return responses, wall_time, max(gaps)
+    
+    responses, wall_time, max_gap = benchmark.pedantic(
+        lambda: asyncio.run(run_batch()), rounds=1
+    )
+    
+    results = [response.json() for response in responses]
+    assert all(response.status_code == 200 for response in responses)
+    assert all(result["metadata"]["solver"] == "cp_sat" for result in results)
+    solve_times = [result["solve_time_ms"] / 1000 for result in results]
+    # Solves overlap instead of queueing behind each other...
+    assert wall_time < sum(solve_times) / 2
+    # ...and never block the event loop while they run
+    assert max_gap < min(solve_times) / 2
+
+def test_lifespan_shuts_down_solver_executor():
+    """Test that the solver executor is shut down with the app and recreated on demand"""
+    with TestClient(app) as lifespan_client:
+        response = lifespan_client.post("/optimize", json=make_random_request(2, 1).model_dump())
+        assert response.status_code == 200
+        executor = main.get_solver_executor()
+    
+    assert main._solver_executor is None
+    assert executor._shutdown
+    assert main.get_solver_executor() is not executor
+
+def test_optimization_without_feasible_channel():
+    """Test fallback when an order has no channel within its limits"""
+    request = {
+        "orders": [
+            {
+                "id": "order_1",
+                "pickup_location": {"lat": 40.7128, "lng": -74.0060},
+                "delivery_location": {"lat": 40.7589, "lng": -73.9851},
+                "max_delivery_time": 10
+            }
+        ],
+        "channels": [
+            {
+                "id": "channel_1",
+                "capacity": 10,
+                "prep_time_minutes": 30,
+                "location": {"lat": 40.7128, "lng": -74.0060}
+            }
+        ]
+    }
+    
+    response = client.post("/optimize", json=request)
+    assert response.status_code == 200
+    
+    data = response.json()
+    assert data["status"] == "FALLBACK"
+    assert data["assignments"] == {"order_1": "channel_1"}
+    assert data["metadata"]["fallback_reason"] == "Order without feasible channel"
+
+class InMemoryRedis:
+    """Minimal async stand-in for the Redis commands used by the cache"""
+    
+    def __init__(self):
+        self.values = {}
+    
+    async def get(self, key):
+        return self.values.get(key)
+    
+    async def setex(self, key, ttl, value):
+        self.values[key] = value
+
+def wraps_counting(func):
+    """Wrap a function and count its calls"""
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return func(*args, **kwargs)
+    wrapper.calls = 0
+    return wrapper
+
+def test_optimization_cache(monkeypatch):
+    """Test that repeated requests are served from the response cache"""
+    cache = InMemoryRedis()
+    monkeypatch.setattr(main, "redis_client", cache)
+    monkeypatch.setattr(optimizer, "optimize_routing", wraps_counting(optimizer.optimize_routing))
+    request = make_random_request(3, 2).model_dump()
+    
+    first = client.post("/optimize", json=request)
+    second = client.post("/optimize", json=request)
+    
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert optimizer.optimize_routing.calls == 1
+    assert len(cache.values) == 1
+
+def test_optimization_cache_skips_fallback(monkeypatch):
+    """Test that fallback responses are not cached"""
+    cache = InMemoryRedis()
+    monkeypatch.setattr(main, "redis_client", cache)
+    request = make_random_request(1, 1).model_dump()
+    request["orders"][0]["max_delivery_time"] = 1  # No channel can make it in time
+    
+    response = client.post("/optimize", json=request)
+    
+    assert response.status_code == 200
+    assert response.json()["status"] == "FALLBACK"
+    assert cache.values == {}
+
+def test_orjson_log_serializer():
+    """Test that the log serializer falls back to repr for unknown types"""
+    assert main.orjson_dumps({"event": "x", "count": 1}) == '{"event":"x","count":1}'
+    assert main.orjson_dumps({"value": object()}, default=repr).startswith('{"value":"<object')
+
+def test_log_level_configures_service_logger(monkeypatch):
+    """Test that LOG_LEVEL is case-insensitive and only applies to the service logger"""
+    monkeypatch.setattr(settings, "log_level", "debug")
+    spec = importlib.util.spec_from_file_location("main_debug_logging", main.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    
+    assert logging.getLogger("main_debug_logging").level == logging.DEBUG
+    assert not logging.getLogger("httpx").isEnabledFor(logging.INFO)
+
+def test_main_can_be_imported_twice():
+    """Test that re-executing main.py reuses the registered metrics"""
+    spec = importlib.util.spec_from_file_location("__mp_main__", main.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    
+    assert module.optimization_requests is main.optimization_requests
+    assert module.optimization_duration is main.optimization_duration
+
 def test_optimization_validation():
     """Test input validation"""
     # Test with invalid weights
@@ -126,6 +464,49 @@ def test_optimization_validation():
     response = client.post("/optimize", json=invalid_request)
     assert response.status_code == 422  # Validation error
 
+def test_unknown_weight_key():
+    """Test that weights must use the known keys"""
+    request = make_random_request(1, 1).model_dump()
+    request["weights"] = {"delivery_time": 0.5, "cost": 0.3, "speed": 0.2}
+    
+    response = client.post("/optimize", json=request)
+    assert response.status_code == 422  # Validation error
+
+def test_unknown_field():
+    """Test that unknown request fields are rejected"""
+    request = make_random_request(1, 1).model_dump()
+    request["orders"][0]["color"] = "blue"
+    
+    response = client.post("/optimize", json=request)
+    assert response.status_code == 422  # Validation error
+
+def test_weights_vec():
+    """Test that weights are resolved to a tuple in kernel order"""
+    request = make_random_request(1, 1)
+    assert request.weights_vec == (0.5, 0.3, 0.2)
+
+def test_invalid_location():
+    """Test location validation"""
+    request = {
+        "orders": [
+            {
+                "id": "order_1",
+                "pickup_location": {"lat": 40.7128},  # Missing lng
+                "delivery_location": {"lat": 40.7589, "lng": -73.9851}
+            }
+        ],
+        "channels": [
+            {
+                "id": "channel_1",
+                "capacity": 10,
+                "location": {"lat": 40.7128, "lng": -74.0060}
+            }
+        ]
+    }
+    
+    response = client.post("/optimize", json=request)
+    assert response.status_code == 422  # Validation error
+
 def test_empty_orders():
     """Test with empty orders list"""
     request = {
@@ -0,0 +1,34 @@
+import pytest
+import numpy as np
+from optimization_kernels import build_score_matrix, haversine_distance
+
+def test_haversine_distance():
+    """Test Haversine distance against known values"""
+    new_york = np.radians([40.7128, -74.0060])
+    london = np.radians([51.5074, -0.1278])
+    
+    assert haversine_distance(*new_york, *new_york) == pytest.approx(0.0)
+    assert haversine_distance(*new_york, *london) == pytest.approx(5570, rel=0.01)
+
+def test_build_score_matrix():
+    """Test scores and feasibility for a single order against two channels"""
+    coords = np.radians([[40.7128, -74.0060], [40.7589, -73.9851]])
+    
+    scores, feasible = build_score_matrix(
+        coords[:, 0], coords[:, 1],  # Channels
+        coords[:1, 0], coords[:1, 1],  # Pickup at the first channel
+        coords[:1, 0], coords[:1, 1],  # Delivery at the pickup
+        np.array([30.0, 30.0]),  # Prep time
+        np.array([10.0, 0.0]),  # Cost
+        np.array([100.0, 100.0]),  # Quality
+        np.array([50.0, 1.0]),  # Max distance
+        np.array([60.0]),  # Max delivery time
+        np.array([1.0]),  # Priority
+        0.5, 0.5, 0.0
+    )
+    
+    assert scores.shape == (1, 2)
+    assert scores.dtype == np.int64
+    # 30 min prep at zero distance plus cost 10, weighted 0.5/0.5, scaled by 100
+    assert scores[0, 0] == 2000
+    assert feasible.tolist() == [[True, False]]  # Second channel is ~5.4 km away